@@ -43,7 +43,8 @@ if sys.version_info < (2, 4):
     sys.exit(2)
 import re
 from random import randint
-from operator import itemgetter
+from operator import itemgetter, attrgetter
+from collections import deque
 
 ######################################################################
 
@@ -65,10 +66,10 @@ NONVERIDICAL = "_NONVER"
 VERIDICAL = ""
 
 # This listing approximates the semantic property of downward entailingness.
-DOWNWARD_MORPHEMES = ("not", "never", "nothing", "no", "n't", "nowhere", "none", "few", "seldom", "rarely")
+DOWNWARD_MORPHEMES = frozenset(["not", "never", "nothing", "no", "n't", "nowhere", "none", "few", "seldom", "rarely"])
 
 # This listing approximates the semantic property of nonveridicality.
-NONVERIDICAL_MORPHEMES = ('accept', 'accepts', 'accepted', 'accepting',
+NONVERIDICAL_MORPHEMES = frozenset(['accept', 'accepts', 'accepted', 'accepting',
                           'advertise', 'advertises', 'advertised', 'advertising',
                           'advocate', 'advocates', 'advocated', 'advocating',
                           'affirm', 'affirms', 'affirmed', 'affirming',
@@ -138,15 +139,19 @@ NONVERIDICAL_MORPHEMES = ('accept', 'accepts', 'accepted', 'accepting',
                           'want', 'wants', 'wanted', 'wanting',
                           'wish', 'wishes', 'wished', 'wishing',
                           'wonder', 'wonders', 'wondered', 'wondering'
-                          )
+                          ])
 
-# This tuple approximates the semantic property of non-veridicality.
-NONVERIDICAL_RELATIONS = ("xcomp", "ccomp", "pcomp")
+# This set approximates the semantic property of non-veridicality.
+NONVERIDICAL_RELATIONS = frozenset(["xcomp", "ccomp", "pcomp"])
 
 # These relations do not propagate scope: items in syntactic scope of
 # an operator by strict structural considerations are excluded if
 # their immediate link is through one of these.
-NONSCOPE_RELATIONS = ("dep", "conj_but", "conj_and", "parataxis", "advcl", "rcmod")
+NONSCOPE_RELATIONS = frozenset(["dep", "conj_but", "conj_and", "parataxis", "advcl", "rcmod"])
+
+# Matches the relations in a Stanford dependency parse string, as
+# (rel, from_node, to_node) triples.
+EDGE_RE = re.compile(r"(\w+)\((.+?),\s+([^\)]+)\)", re.MULTILINE | re.DOTALL)
 
 ######################################################################
 
@@ -168,10 +173,38 @@ class Tree:
         
         """
         # Pull out the relations.
-        edge_re = re.compile(r"(\w+)\((.+?),\s+([^\)]+)\)", re.MULTILINE | re.DOTALL)
-        edges = edge_re.findall(s)
-        self.edges = map(Edge, edges)
+        edges = EDGE_RE.findall(s)
+        # Build each distinct node string only once, so that edges
+        # sharing a word share its Node object.
+        node_cache = {}
+        for rel, from_node, to_node in edges:
+            for node_str in (from_node, to_node):
+                if node_str not in node_cache:
+                    node_cache[node_str] = Node(node_str)
+        self.edges = [Edge((rel, node_cache[from_node], node_cache[to_node])) for rel, from_node, to_node in edges]
         self.nodes = self.get_nodes()
+        # Index the edges by their endpoints, so that get_edge() need
+        # not scan the whole edge list. Where there are multiple
+        # edges between the same nodes, the first one wins.
+        self._edge_index = {}
+        for e in self.edges:
+            self._edge_index.setdefault((e.from_node, e.to_node), e)
+        # Map each node to its (daughter, relation) pairs, in linear
+        # order.
+        self._children = {}
+        for e in self.edges:
+            if self._edge_index[(e.from_node, e.to_node)] is e:
+                self._children.setdefault(e.from_node, []).append((e.to_node, e.rel))
+        for daughts in self._children.itervalues():
+            daughts.sort(key=lambda pair : pair[0].index)
+        # The determiner and modifier daughters of each node, for
+        # downward_spread(). Only the structure is fixed here; their
+        # markings are checked when downward_spread() is called.
+        self._det_daughters = {}
+        for mom, daughts in self._children.iteritems():
+            dets = [n for n, rel in daughts if rel in ("det", "amod")]
+            if dets:
+                self._det_daughters[mom] = dets
 
     def polarity_marking(self):
         """
@@ -200,6 +233,9 @@ class Tree:
         spread_function -- function for handling the intial spread (for self.polarity_marking(), this is
         self.downward_daughters(); for self.veridicality_marking(), this is self.nonveridical_daughters())
         """
+        # The tree's shape doesn't change while we mark it, so the
+        # paths can be worked out once, up front.
+        reach = self.reachability(blockers=NONSCOPE_RELATIONS)
         # Propagate the basic markings.
         for mom in self.nodes:
             for daught in spread_function(mom):                
@@ -207,8 +243,8 @@ class Tree:
                 for d_prime in self.daughters(mom, blockers=NONSCOPE_RELATIONS):                   
                     if daught != d_prime and daught.index < d_prime.index:
                         d_prime.update_marking(marking)
-                        for n2 in self.nodes:
-                            if self.path(d_prime, n2, blockers=NONSCOPE_RELATIONS) and daught.index < n2.index:    
+                        for n2 in reach[d_prime]:
+                            if daught.index < n2.index:    
                                 n2.update_marking(marking)
 
     def downward_spread(self, n):
@@ -219,26 +255,26 @@ class Tree:
         determiner daughter that is DOWNWARD.
         """
         dd = []
-        if n.scope_markings[MONOTONICITY] == DOWNWARD:
+        if n.is_downward:
             dd.append(n)
         for daught in self.daughters(n):
-            if daught.scope_markings[MONOTONICITY] == DOWNWARD:
+            if daught.is_downward:
                 dd.append(daught)
             else:
                 # This spreads to determiner relations, allowing them to exter their semantic influence.
-                for grand_daught in self.daughters(daught):
-                    if self.get_edge(daught, grand_daught).rel in ("det", "amod") and grand_daught.scope_markings[MONOTONICITY] == DOWNWARD:
+                for grand_daught in self._det_daughters.get(daught, ()):
+                    if grand_daught.is_downward:
                         dd.append(daught)
         return dd
 
     def nonveridical_spread(self, n):
         """Returns the set of daughters of Node n that are nonveridical entailing."""
         dd = []
-        if n.scope_markings[VERIDICALITY] == NONVERIDICAL:
+        if n.is_nonveridical:
             dd.append(n)
         for daught in self.daughters(n):
             # The first conjunct ensures veridicality. The second helps limit to the syntactic environments we want.
-            if daught.scope_markings[VERIDICALITY] == NONVERIDICAL and self.get_edge(n, daught).rel in ("xcomp", "ccomp", "pcomp"):
+            if daught.is_nonveridical and self.get_edge(n, daught).rel in NONVERIDICAL_RELATIONS:
                 dd.append(daught)
         return dd
     
@@ -248,53 +284,60 @@ class Tree:
     
     def words_with_scope_markings(self):
         """Returns the list of words with scope-marking labels in linear order."""
-        marked_nodes = []
-        for node in self.nodes:
-            sm = []
-            for key, val in sorted(node.scope_markings.items()):
-                sm.append(val)
-            marked_nodes.append(node.word + "".join(sm))
-        return marked_nodes
+        # The markings are appended in the alphabetical order of their
+        # keys, MONOTONICITY before VERIDICALITY.
+        return [node.word + node.scope_markings[MONOTONICITY] + node.scope_markings[VERIDICALITY] for node in self.nodes]
     
     def get_edge(self, x, y):
         """Returns the edge from Node x to Node y if there is one, else None."""
-        for e in self.edges:
-            if e.from_node == x and e.to_node == y:
-                return e
-        return None
+        return self._edge_index.get((x, y))
     
     def daughters(self, x, blockers=NONSCOPE_RELATIONS):
         """Returns the list of daughters of Node x."""
-        daughts = []
-        for n in self.nodes:
-            e = self.get_edge(x, n)
-            if e and e.rel not in blockers:
-                daughts.append(n)
-        return daughts
+        return [n for n, rel in self._children.get(x, ()) if rel not in blockers]
 
     def path(self, x, y, blockers=NONSCOPE_RELATIONS):
         """Returns True if there is a path from Node x to Node y, else False."""
-        daughts = self.daughters(x, blockers=NONSCOPE_RELATIONS)
-        if y in daughts:
-            return True
-        else:
-            for daught in daughts:
-                if self.path(daught, y, blockers=blockers):
+        # Breadth-first, keeping track of visited nodes so that cycles
+        # in the input can't send us into an infinite loop.
+        seen = set([x])
+        agenda = deque([x])
+        while agenda:
+            for daught in self.daughters(agenda.popleft(), blockers=blockers):
+                if daught == y:
                     return True
+                if daught not in seen:
+                    seen.add(daught)
+                    agenda.append(daught)
         return False
 
+    def reachability(self, blockers=NONSCOPE_RELATIONS):
+        """
+        Returns a dict mapping each Node x to the set of Nodes y such
+        that self.path(x, y, blockers=blockers) is True.
+        """
+        reach = {}
+        for n in self.nodes:
+            seen = set([])
+            agenda = [n]
+            while agenda:
+                for daught in self.daughters(agenda.pop(), blockers=blockers):
+                    if daught not in seen:
+                        seen.add(daught)
+                        agenda.append(daught)
+            reach[n] = seen
+        return reach
+
     def get_nodes(self):
         """
         Utility function. Returns the set of nodes, ordered by their
-        linear order in the string.  We use a dictionary from strings
-        to nodes to get the set of unique nodes because Node objects
-        aren't hashable.
+        linear order in the string.
         """
         nodes = {}        
         for e in self.edges:
-            nodes[unicode(e.from_node)] = e.from_node
-            nodes[unicode(e.to_node)] = e.to_node
-        return sorted(nodes.values(), cmp=((lambda x, y : cmp(x.index, y.index))))
+            nodes[e.from_node] = e.from_node
+            nodes[e.to_node] = e.to_node
+        return sorted(nodes.values(), key=attrgetter("index"))
 
     def nodes_by_index(self):
         """
@@ -318,21 +361,19 @@ class Tree:
         Keyword argument
         caption -- a string to include as a label for the tree (default: "")
         """        
-        s = "digraph g {\n"
-        s += 'label="%s"; fontsize="14"\n' % caption
-        fontsize=12;
-        for node in self.nodes:
-            s += "\t" + node.to_graphviz() + "\n"
-        for edge in self.edges:
-            s += "\t" + edge.to_graphviz() + "\n"
-        s += "}"
-        return s
+        lines = ["digraph g {", 'label="%s"; fontsize="14"' % caption]
+        lines += ["\t" + node.to_graphviz() for node in self.nodes]
+        lines += ["\t" + edge.to_graphviz() for edge in self.edges]
+        lines.append("}")
+        return "\n".join(lines)
 
 ######################################################################
     
-class Edge:
+class Edge(object):
     """
-    An Edge is two Node objects and an edge relation.
+    An Edge is two Node objects and an edge relation. It is built
+    from a (rel, from_node, to_node) tuple, where the nodes are either
+    Node objects or strings of the form word-index.
 
     Attributes:
     rel -- the edge relation
@@ -341,12 +382,31 @@ class Edge:
     start -- the index of from_node (for linear ordering)
     finish -- the index of to_node (for linear ordering)
     """
+    # A parsed corpus holds a great many of these, so we do without a
+    # per-instance __dict__.
+    __slots__ = ("rel", "from_node", "to_node", "start", "finish", "graphviz_cache")
+
     def __init__(self, tup):
         rel, from_node, to_node = tup
         self.rel = rel
-        self.from_node = Node(from_node)
-        self.to_node = Node(to_node)
+        if not isinstance(from_node, Node):
+            from_node = Node(from_node)
+        if not isinstance(to_node, Node):
+            to_node = Node(to_node)
+        self.from_node = from_node
+        self.to_node = to_node
         self.start, self.finish = sorted([self.from_node.index, self.to_node.index])
+        # Filled in by to_graphviz() the first time it is called.
+        self.graphviz_cache = None
+
+    def __getstate__(self):
+        """The slot values, for pickling, since there is no __dict__."""
+        return dict([(attr, getattr(self, attr)) for attr in self.__slots__])
+
+    def __setstate__(self, state):
+        """Restores the slot values saved by __getstate__()."""
+        for attr, val in state.iteritems():
+            setattr(self, attr, val)
 
     def __str__(self):
         """String output mimicking the input format."""
@@ -355,24 +415,35 @@ class Edge:
     def to_graphviz(self):
         """
         Graphviz code string. This method is called by
-        Tree.to_graphviz().
+        Tree.to_graphviz(). The string depends only on the words,
+        indices, and relation, so it is built once and cached.
         """
-        return '"%(f)s-%(fi)s" -> "%(t)s-%(ti)s" [label="%(r)s"]' % {"f":self.from_node.word,
-                                                                     "fi":self.from_node.index,
-                                                                     "t":self.to_node.word,
-                                                                     "ti":self.to_node.index,
-                                                                     "r":self.rel}
+        if self.graphviz_cache is None:
+            self.graphviz_cache = '"%(f)s-%(fi)s" -> "%(t)s-%(ti)s" [label="%(r)s"]' % {"f":self.from_node.word,
+                                                                                        "fi":self.from_node.index,
+                                                                                        "t":self.to_node.word,
+                                                                                        "ti":self.to_node.index,
+                                                                                        "r":self.rel}
+        return self.graphviz_cache
     
 ######################################################################
     
-class Node:
+class Node(object):
     """
     A Node object has a label, an index, and attributes for polarity
     and verdicality marking. The marking is handled by a dict valued
     attribute self.scope_markings, which is set to record lexical
     values here. The method update_marking handles changes to the
     markings.
+
+    The boolean attributes is_downward and is_nonveridical mirror
+    scope_markings, for the sake of the spread functions of Tree,
+    which test them in their inner loops. update_marking keeps them in
+    step with scope_markings.
     """
+    # See the comment on Edge.__slots__.
+    __slots__ = ("word", "index", "scope_markings", "is_downward", "is_nonveridical", "graphviz_cache")
+
     def __init__(self, s):
         word, index = s.rsplit("-", 1)
         self.word = word
@@ -381,32 +452,52 @@ class Node:
             self.index = int(index.rstrip("'")) + 5000
         else:
             self.index = int(index)
+        # Filled in by to_graphviz(), and cleared by update_marking().
+        self.graphviz_cache = None
         # Lexical values for the scope-marking properties.
         self.scope_markings = {}
-        if self.word in DOWNWARD_MORPHEMES:
+        self.is_downward = self.word in DOWNWARD_MORPHEMES
+        if self.is_downward:
             self.scope_markings[MONOTONICITY] = DOWNWARD
         else:
             self.scope_markings[MONOTONICITY] = UPWARD
-        if self.word in NONVERIDICAL_MORPHEMES:
+        self.is_nonveridical = self.word in NONVERIDICAL_MORPHEMES
+        if self.is_nonveridical:
             self.scope_markings[VERIDICALITY] = NONVERIDICAL
         else:
             self.scope_markings[VERIDICALITY] = VERIDICAL
 
+    def __getstate__(self):
+        """The slot values, for pickling, since there is no __dict__."""
+        return dict([(attr, getattr(self, attr)) for attr in self.__slots__])
+
+    def __setstate__(self, state):
+        """Restores the slot values saved by __getstate__()."""
+        for attr, val in state.iteritems():
+            setattr(self, attr, val)
+
     def update_marking(self, marking):
         """
         Update scope_markings with marking, checking to make
         sure that we make the appropriate change to the current
         values.
         """        
+        self.graphviz_cache = None
         if marking in (UPWARD, DOWNWARD):
             self.scope_markings[MONOTONICITY] = marking
+            self.is_downward = marking == DOWNWARD
         elif marking in (VERIDICAL, NONVERIDICAL):
             self.scope_markings[VERIDICALITY] = marking
+            self.is_nonveridical = marking == NONVERIDICAL
 
     def __eq__(self, node):
         """True iff both word and index match. (Ignores the scope marking.)"""
         return self.word == node.word and self.index == node.index
 
+    def __hash__(self):
+        """Hashes on word and index, in keeping with __eq__."""
+        return hash((self.word, self.index))
+
     def __neq__(self, node):
         """True iff __eq__ says False."""
         return not self.__eq__(node)
@@ -433,8 +524,11 @@ class Node:
         """
         Graphviz code string. NEGATIVE nodes are black with white
         lettering, and NONVERIDICAL nodes are diamond shaped. This
-        method is called by Tree.to_graphviz().
+        method is called by Tree.to_graphviz(). The string is cached
+        until the next call to update_marking().
         """
+        if self.graphviz_cache is not None:
+            return self.graphviz_cache
         style ="unfilled"
         shape = "oval"
         fontcolor = "black"
@@ -443,11 +537,12 @@ class Node:
             fontcolor = "white"
         if self.scope_markings[VERIDICALITY] == NONVERIDICAL:
             shape = "Mdiamond"
-        return '"%(w)s-%(i)s" [label="%(w)s", color="black", fontcolor="%(fc)s", style="%(style)s", shape="%(shape)s"];' % {"w":self.word,
-                                                                                                                            "i":self.index,
-                                                                                                                            "style":style,
-                                                                                                                            "fc":fontcolor,
-                                                                                                                            "shape":shape}
+        self.graphviz_cache = '"%(w)s-%(i)s" [label="%(w)s", color="black", fontcolor="%(fc)s", style="%(style)s", shape="%(shape)s"];' % {"w":self.word,
+                                                                                                                                          "i":self.index,
+                                                                                                                                          "style":style,
+                                                                                                                                          "fc":fontcolor,
+                                                                                                                                          "shape":shape}
+        return self.graphviz_cache
         
 ######################################################################
 
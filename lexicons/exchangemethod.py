@@ -47,9 +47,19 @@ Stanford, Fall 2010.
 """
 
 import sys
-from copy import deepcopy
 from math import factorial
-from random import randint, shuffle
+from random import shuffle
+try:
+    import numpy
+except ImportError:
+    # Optional: without it, the default objective function falls back
+    # to looping over the scoring dictionary.
+    numpy = None
+
+# Changes to the objective value smaller than this are treated as no
+# change by ExchangeMethod.hatzivassiloglou_mckeown_exchange(), whose
+# incremental updates pick up floating-point error.
+TOLERANCE = 1e-9
 
 ######################################################################
 
@@ -76,6 +86,31 @@ class ExchangeMethod:
             self.objective_function = objective_function
         else:
             self.objective_function = self.hatzivassiloglou_mckeown_objective_function
+        # For the default objective function, exchange() works with
+        # the values in d involving each word, so we index them here:
+        # neighbors[w] is a list of pairs (w2, d[(w, w2)] or d[(w2, w)]).
+        self.neighbors = {}
+        if self.objective_function == self.hatzivassiloglou_mckeown_objective_function:
+            for (w1, w2), val in self.d.iteritems():
+                if w1 != w2:
+                    self.neighbors.setdefault(w1, []).append((w2, val))
+                    self.neighbors.setdefault(w2, []).append((w1, val))
+        # With numpy, the default objective function also works from a
+        # copy of d as parallel arrays: words are mapped to integer ids
+        # by word_id, and the entry for the ith key of d (with
+        # w1 != w2) is (w1_idx[i], w2_idx[i], vals[i]).
+        self.word_id = None
+        if numpy is not None and self.objective_function == self.hatzivassiloglou_mckeown_objective_function:
+            self.word_id = {}
+            for w in self.words:
+                self.word_id.setdefault(w, len(self.word_id))
+            keys = [key for key in self.d if key[0] != key[1]]
+            for w1, w2 in keys:
+                self.word_id.setdefault(w1, len(self.word_id))
+                self.word_id.setdefault(w2, len(self.word_id))
+            self.w1_idx = numpy.array([self.word_id[key[0]] for key in keys], dtype=numpy.int32)
+            self.w2_idx = numpy.array([self.word_id[key[1]] for key in keys], dtype=numpy.int32)
+            self.vals = numpy.array([self.d[key] for key in keys], dtype=numpy.float64)
 
     def initial_objective_value(self):
         """The value of the objective function for self.initial_cells."""
@@ -86,7 +121,9 @@ class ExchangeMethod:
         Controls the iterative optimization. The real work is done by
         self.exchange().
         """        
-        cells = deepcopy(self.initial_cells)        
+        # Copy the cells themselves, so that self.initial_cells is left
+        # alone; their members are hashable and needn't be copied.
+        cells = [set(cell) for cell in self.initial_cells]
         # Initial value of the objective function.
         obj_val = self.objective_function(cells, self.d)    
         # We exit this loop when a call to exchange() yields no
@@ -120,37 +157,115 @@ class ExchangeMethod:
         cells (list of sets) -- the potentially different partition
         obj_val (float) -- the best improvement possible
         """
+        if self.objective_function == self.hatzivassiloglou_mckeown_objective_function:
+            return self.hatzivassiloglou_mckeown_exchange(cells, obj_val)
+        # Cell membership, kept up to date as words move.
+        cell_of = {}
+        for i, cell in enumerate(cells):
+            for w in cell:
+                cell_of[w] = i
         total = len(self.words)
         for i, w in enumerate(self.words):
             # Over-writing progress report and informal speed assessment.
             sys.stderr.write("\r",) ; sys.stderr.write("\tEvaluating word %s of %s" % (i+1, total)) ; sys.stderr.flush()
             # Get the membership for w.
-            w_cell_index = self.current_cell_index(w, cells)
-            # Calculate the objective values for making this change.
-            candidate_objective_values = []
-            for other_cell_index in xrange(len(cells)):
-                # Check only distinct values for cells, and never move a word out of a singleton cell.
-                if other_cell_index != w_cell_index and len(cells[w_cell_index]) > 1:
-                    # This copy is made for the hypothetical objective
-                    # function calculation.  This could be optimized, by
-                    # passing cells itself with index points for which
-                    # cells to change, and how, but probably at a loss of
-                    # generality when it comes to the objective functions
-                    # we can accommodate.
-                    temp_cells = deepcopy(cells)
-                    temp_cells[w_cell_index] = cells[w_cell_index] - set([w])
-                    temp_cells[other_cell_index] = cells[other_cell_index] | set([w])                
-                    new_val = self.objective_function(temp_cells, self.d)
-                    # Add a new index iff it would lead to an improvement.
-                    if new_val < obj_val:                    
-                        candidate_objective_values.append((new_val, other_cell_index))                
-                # Determine which objective change is the most beneficial, if any.
-                if candidate_objective_values:
-                    # The best objective function is the smallest one.
-                    obj_val, max_cell_index = sorted(candidate_objective_values)[0]
-                    # Make the change.
-                    cells[w_cell_index] = cells[w_cell_index] - set([w])
-                    cells[max_cell_index] = cells[max_cell_index] | set([w])
+            w_cell_index = cell_of[w]
+            # Find the best improving move for w, if any. Never move a
+            # word out of a singleton cell.
+            best_val, best_cell_index = obj_val, None
+            if len(cells[w_cell_index]) > 1:
+                for other_cell_index in xrange(len(cells)):
+                    if other_cell_index != w_cell_index:
+                        # This copy is made for the hypothetical objective
+                        # function calculation. Only the list is copied: the
+                        # two cells that change are replaced with new sets
+                        # below, and the rest are shared with cells, which
+                        # is fine as long as the objective function doesn't
+                        # modify its input. (The default objective function
+                        # avoids this step entirely; see
+                        # hatzivassiloglou_mckeown_exchange().)
+                        temp_cells = list(cells)
+                        temp_cells[w_cell_index] = cells[w_cell_index] - set([w])
+                        temp_cells[other_cell_index] = cells[other_cell_index] | set([w])
+                        new_val = self.objective_function(temp_cells, self.d)
+                        if new_val < best_val:
+                            best_val, best_cell_index = new_val, other_cell_index
+            # Make the change.
+            if best_cell_index is not None:
+                obj_val = best_val
+                cells[w_cell_index] = cells[w_cell_index] - set([w])
+                cells[best_cell_index] = cells[best_cell_index] | set([w])
+                cell_of[w] = best_cell_index
+        return [cells, obj_val]
+
+    def hatzivassiloglou_mckeown_exchange(self, cells, obj_val):
+        """
+        The version of exchange() used with the default objective
+        function. Instead of re-evaluating the objective function for
+        every candidate move, it keeps, for each cell, the sum of
+        1.0 - d[key] over the keys of d inside the cell and the number
+        of such keys. The change in the objective function from moving
+        a word then depends only on the entries of d involving that
+        word, which self.neighbors supplies.
+
+        Arguments and output are as for exchange().
+        """
+        # Cell membership, and the per-cell totals described above.
+        cell_of = {}
+        for i, cell in enumerate(cells):
+            for w in cell:
+                cell_of[w] = i
+        dist_sums = [0.0] * len(cells)
+        pair_counts = [0] * len(cells)
+        for (w1, w2), val in self.d.iteritems():
+            if w1 != w2 and w1 in cell_of and cell_of.get(w2) == cell_of[w1]:
+                dist_sums[cell_of[w1]] += 1.0 - val
+                pair_counts[cell_of[w1]] += 1
+        total = len(self.words)
+        for i, w in enumerate(self.words):
+            # Over-writing progress report and informal speed assessment.
+            sys.stderr.write("\r",) ; sys.stderr.write("\tEvaluating word %s of %s" % (i+1, total)) ; sys.stderr.flush()
+            src = cell_of[w]
+            # Never move a word out of a singleton cell.
+            if len(cells[src]) < 2:
+                continue
+            # The totals for the keys of d involving w, grouped by the
+            # cell of the other word.
+            w_dist_sums = [0.0] * len(cells)
+            w_pair_counts = [0] * len(cells)
+            for w2, val in self.neighbors.get(w, ()):
+                if w2 in cell_of:
+                    w_dist_sums[cell_of[w2]] += 1.0 - val
+                    w_pair_counts[cell_of[w2]] += 1
+            # The change to w's current cell is the same for every move.
+            src_delta = hatzivassiloglou_mckeown_cell_value(dist_sums[src] - w_dist_sums[src],
+                                                            pair_counts[src] - w_pair_counts[src],
+                                                            len(cells[src]) - 1) \
+                        - hatzivassiloglou_mckeown_cell_value(dist_sums[src], pair_counts[src], len(cells[src]))
+            # Find the move that lowers the objective value the most, if any.
+            best_delta = -TOLERANCE
+            best_dst = None
+            for dst in xrange(len(cells)):
+                if dst != src:
+                    delta = src_delta \
+                            + hatzivassiloglou_mckeown_cell_value(dist_sums[dst] + w_dist_sums[dst],
+                                                                  pair_counts[dst] + w_pair_counts[dst],
+                                                                  len(cells[dst]) + 1) \
+                            - hatzivassiloglou_mckeown_cell_value(dist_sums[dst], pair_counts[dst], len(cells[dst]))
+                    if delta < best_delta:
+                        best_delta = delta
+                        best_dst = dst
+            # Make the change.
+            if best_dst is not None:
+                dst = best_dst
+                cells[src].discard(w)
+                cells[dst].add(w)
+                cell_of[w] = dst
+                dist_sums[src] -= w_dist_sums[src]
+                pair_counts[src] -= w_pair_counts[src]
+                dist_sums[dst] += w_dist_sums[dst]
+                pair_counts[dst] += w_pair_counts[dst]
+                obj_val += best_delta
         return [cells, obj_val]
 
     def hatzivassiloglou_mckeown_objective_function(self, cells, d):
@@ -187,19 +302,37 @@ class ExchangeMethod:
         end.  This saves having to iterate through the 100 missing
         values.
         """    
+        if self.word_id is not None and d is self.d:
+            return self.hatzivassiloglou_mckeown_vectorized_objective_function(cells)
         outer_sum = 0.0    
         for cell in cells:
-            inner_sum = 0.0
-            # Cardinality of the set of all two-members subsets of
-            # cell.  We will deduct 1 every time we find a value for
-            # cell in d.
-            cell_pair_size = binomial_coefficient(cell, k=2)        
+            # The keys of d inside cell: the sum of their distances,
+            # and how many there are. hatzivassiloglou_mckeown_cell_value()
+            # then adds 0.5 for each of cell's pairs not among them.
+            dist_sum = 0.0
+            pair_count = 0
             for key, val in d.iteritems():
                 if key[0] in cell and key[1] in cell and key[0] != key[1]:
-                    inner_sum += 1.0 - d[key]
-                    cell_pair_size -= 1
-            inner_sum += cell_pair_size * 0.5
-            outer_sum += inner_sum/len(cell)
+                    dist_sum += 1.0 - val
+                    pair_count += 1
+            outer_sum += hatzivassiloglou_mckeown_cell_value(dist_sum, pair_count, len(cell))
+        return outer_sum
+
+    def hatzivassiloglou_mckeown_vectorized_objective_function(self, cells):
+        """
+        hatzivassiloglou_mckeown_objective_function() for self.d,
+        computed with the arrays built in __init__ (so numpy is
+        required): a word pair is inside a cell just in case both of
+        its ids are marked in the cell's boolean membership array.
+        """
+        outer_sum = 0.0
+        for cell in cells:
+            in_cell = numpy.zeros(len(self.word_id), dtype=bool)
+            in_cell[[self.word_id[w] for w in cell if w in self.word_id]] = True
+            mask = in_cell[self.w1_idx] & in_cell[self.w2_idx]
+            dist_sum = float((1.0 - self.vals[mask]).sum())
+            pair_count = int(mask.sum())
+            outer_sum += hatzivassiloglou_mckeown_cell_value(dist_sum, pair_count, len(cell))
         return outer_sum
             
     def current_cell_index(self, w, cells):
@@ -214,8 +347,9 @@ class ExchangeMethod:
 
 def random_partition(x, k):
     """
-    Shuffle a deep copy of the input list, pick k random breakpoints
-    and return the partition, as a list of sets.
+    Shuffle a copy of the input list and deal it out into k cells, so
+    that the cell sizes differ by at most one, and return the
+    partition, as a list of sets.
     
     Input
     x -- a list
@@ -227,26 +361,30 @@ def random_partition(x, k):
     # Make sure this is feasible.
     if len(x) < k:
         raise Exception("The number of cells cannot exceed the number of elements in the list. Your list has %s elements and your k is %s" % (len(x), k))
-    x_copy = deepcopy(x)
-    shuffle(x_copy)    
-    # Get the breakpoints.
-    breakpoints = set([])
-    while len(breakpoints) < k-1:
-        breakpoints.add(randint(1, len(x)-2))
-    breakpoints = sorted(list(breakpoints))
-    # Add initial and final indices, for the iteration.
-    breakpoints.insert(0,0)
-    breakpoints.append(len(x))
-    # Create the partition by iterating through pairs (start, finish)
-    # drawn from breakpoints.
-    cells = []
-    i = 0
-    while i < len(breakpoints)-1:
-        start = breakpoints[i]
-        finish = breakpoints[i+1]
-        cells.append(set(x[start:finish]))
-        i += 1
-    return cells
+    # The members are hashable and needn't be copied themselves.
+    x_copy = list(x)
+    shuffle(x_copy)
+    return [set(x_copy[i::k]) for i in xrange(k)]
+
+def hatzivassiloglou_mckeown_cell_value(dist_sum, pair_count, size):
+    """
+    One cell's contribution to the Hatzivassiloglou-McKeown objective
+    function, as computed in
+    ExchangeMethod.hatzivassiloglou_mckeown_objective_function().
+
+    Arguments
+    dist_sum (float) -- the sum of 1.0 - d[key] over the keys of d inside the cell
+    pair_count (int) -- the number of those keys
+    size (int) -- the number of members of the cell
+
+    Output: float
+    """
+    # As in binomial_coefficient(), a cell with fewer than two members
+    # counts as having one pair.
+    missing_pairs = 1 - pair_count
+    if size >= 2:
+        missing_pairs = size * (size - 1) // 2 - pair_count
+    return (dist_sum + missing_pairs * 0.5) / size
 
 def binomial_coefficient(x, k=2):
     """
@@ -264,7 +402,11 @@ def binomial_coefficient(x, k=2):
     n = len(x)
     bc = 1
     if n >= 2:
-        bc = factorial(n) / (factorial(n - k) * factorial(k))
+        if k == 2:
+            # The usual case, without the (possibly huge) factorials.
+            bc = n * (n - 1) // 2
+        else:
+            bc = factorial(n) / (factorial(n - k) * factorial(k))
     return bc
 
 ######################################################################
@@ -22,9 +22,11 @@ using a tiny artificial corpus.  The steps it takes:
 See the bottom of the file for the code that handles all this.
 
 In a gesture at optimization, the co-occurrence matrix stores only one
-of the triagular matrices, and similarly for the mapping from words to
-vectors.  More could be done, though, especialy with the cosine matrix
-itself.
+of the triagular matrices.  The word vectors are the rows of a single
+Numpy array, so that the cosine matrix comes from one matrix product
+rather than a comparison of each pair of words.  For repeated runs
+over the same corpus, save_cosine_similarity_matrix() stores the
+cosine matrix, and load_cosine_similarity_matrix() memory-maps it back.
 
 For more on the nature of the algorithm, see the 'Sentiment lexicons'
 handout from Linguist 287 / CS 424P: Extracting Social Meaning and
@@ -40,11 +42,17 @@ if sys.version_info < (2, 5) or sys.version_info >= (2, 7):
     sys.exit(2)
 from collections import defaultdict
 from operator import itemgetter
+import cPickle as pickle
 try:
-    from numpy import dot, sqrt, array
+    from numpy import dot, sqrt, zeros, outer, where, maximum, newaxis, flatnonzero, asarray, array, float32, triu
+    from numpy import save, load
 except:
     sys.stderr.write("Couldn't find Numpy. To get it: http://numpy.scipy.org/.\n")
 
+# propagate() extends paths through at most this many words at a time,
+# which bounds its temporary arrays at PROPAGATION_BLOCK x vocab.
+PROPAGATION_BLOCK = 256
+
 ######################################################################
 
 def cooccurrence_matrix(corpus):
@@ -55,22 +63,24 @@ def cooccurrence_matrix(corpus):
     corpus (tuple of tuples) -- tokenized texts
 
     Output
-    d -- a two-dimensional defaultdict mapping word pairs to counts
+    d -- a defaultdict mapping word pairs (w1, w2), with w1 <= w2, to counts
     """    
-    d = defaultdict(lambda : defaultdict(int))
+    d = defaultdict(int)
     for text in corpus:
-        for i in xrange(len(text)-1):            
+        # Once the text is sorted, every pair (text[i], text[j]) with
+        # i < j is already in the order in which d stores it.
+        text = sorted(text)
+        for i in xrange(len(text)-1):
+            w1 = text[i]
             for j in xrange(i+1, len(text)):
-                w1, w2 = sorted([text[i], text[j]])                
-                d[w1][w2] += 1
+                d[(w1, text[j])] += 1
     return d
                             
 ######################################################################
 
 def get_sorted_vocab(d):
     """
-    Sort the entire vocabulary (keys and keys of their value
-    dictionaries).
+    Sort the entire vocabulary (the words in the keys of d).
 
     Input
     d -- dictionary mapping word-pairs to counts, created by
@@ -80,10 +90,9 @@ def get_sorted_vocab(d):
     vocab -- sorted list of strings
     """
     vocab = set([])
-    for w1, val_dict in d.iteritems():
+    for w1, w2 in d.iterkeys():
         vocab.add(w1)
-        for w2 in val_dict.iterkeys():
-            vocab.add(w2)
+        vocab.add(w2)
     vocab = sorted(list(vocab))
     return vocab
 
@@ -95,24 +104,26 @@ def cosine_similarity_matrix(vocab, d):
 
     Input
     vocab -- a list of words derived from the keys of d
-    d -- a two-dimensional defaultdict mapping word pairs to counts,
-    as created by cooccurrence_matrix()
+    d -- a defaultdict mapping word pairs to counts, as created by
+    cooccurrence_matrix()
 
     Output
-    cm -- a two-dimensional defaultdict mapping word pairs to their
-    cosine similarity according to d    
+    cm -- a float32 array whose (i, j) cell is the cosine similarity
+    of vocab[i] and vocab[j] according to d
     """
-    cm = defaultdict(dict)
     vectors = get_vectors(d, vocab)
-    for w1 in vocab:
-        for w2 in vocab:
-            cm[w1][w2] = cosim(vectors[w1], vectors[w2])
+    # All the dot products at once, and the products of the norms.
+    num = dot(vectors, vectors.T)
+    norms = sqrt((vectors * vectors).sum(axis=1))
+    den = outer(norms, norms)
+    # Words with all-0 vectors get similarity 0.0 with everything.
+    cm = num / where(den > 0, den, 1.0)
     return cm
 
 def get_vectors(d, vocab):
     """
-    Interate through the vocabulary, creating the vector for each word
-    in it.
+    Build the vectors for the words in the vocabulary, as the rows of
+    a (symmetric) array.
 
     Input
     d -- dictionary mapping word-pairs to counts, created by
@@ -120,25 +131,61 @@ def get_vectors(d, vocab):
     vocab -- sorted vocabulary created by get_sorted_vocab()
 
     Output
-    vecs -- dictionary mapping words to their vectors.
+    vecs -- float32 array whose ith row is the vector for vocab[i]
     """    
-    vecs = {}
-    for w1 in vocab:
-        v = []
-        for w2 in vocab:
-            wA, wB = sorted([w1, w2])
-            v.append(d[wA][wB])
-        vecs[w1] = array(v)
+    index = dict([(w, i) for i, w in enumerate(vocab)])
+    # Single precision is plenty for counts and the cosines derived
+    # from them, and it halves the memory that cosine_similarity_matrix()
+    # and propagate() have to move.
+    vecs = zeros((len(vocab), len(vocab)), dtype=float32)
+    if d:
+        # All the cells at once: row and column indices for the pairs,
+        # then both triangles.
+        rows = array([index[w1] for w1, w2 in d.iterkeys()])
+        cols = array([index[w2] for w1, w2 in d.iterkeys()])
+        counts = array(d.values(), dtype=float32)
+        vecs[rows, cols] = counts
+        vecs[cols, rows] = counts
     return vecs
 
-def cosim(v1, v2):
-    """Cosine similarity between the two vectors v1 and v2."""
-    num = dot(v1, v2)
-    den = sqrt(dot(v1, v1)) * sqrt(dot(v2, v2))
-    if den:
-        return num/den
-    else:
-        return 0.0
+def save_cosine_similarity_matrix(vocab, cm, basename):
+    """
+    Saves cm in Numpy's format as basename.npy, and vocab, pickled, as
+    basename.vocab, for load_cosine_similarity_matrix().
+
+    Input
+    vocab -- the sorted vocabulary for cm
+    cm -- cosine similarity matrix created by cosine_similarity_matrix()
+    basename -- path for the two files, without extensions
+    """
+    save(basename + ".npy", cm)
+    f = open(basename + ".vocab", "wb")
+    try:
+        pickle.dump(vocab, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+
+def load_cosine_similarity_matrix(basename):
+    """
+    Loads the files written by save_cosine_similarity_matrix(). The
+    matrix is memory-mapped read-only rather than read in, so rebuilding
+    or loading it doesn't dominate runs with different seed sets, and
+    only the parts that propagate() touches are read from disk.
+
+    Input
+    basename -- path for the two files, without extensions
+
+    Output
+    vocab -- the sorted vocabulary for cm
+    cm -- the cosine similarity matrix, as a read-only memory-mapped array
+    """
+    f = open(basename + ".vocab", "rb")
+    try:
+        vocab = pickle.load(f)
+    finally:
+        f.close()
+    cm = load(basename + ".npy", mmap_mode="r")
+    return [vocab, cm]
 
 ######################################################################
 
@@ -147,7 +194,7 @@ def graph_propagation(cm, vocab, positive, negative, iterations):
     The propagation algorithm employing the cosine values.
 
     Input
-    cm -- cosine similarity matrix (2-d dictionary) created by cosine_similarity_matrix()
+    cm -- cosine similarity matrix (array) created by cosine_similarity_matrix()
     vocab -- vocabulary for cm
     positive -- list of strings
     negative -- list of strings
@@ -156,52 +203,70 @@ def graph_propagation(cm, vocab, positive, negative, iterations):
     Output:
     pol -- a dictionary form vocab to floats
     """
-    pol = {}    
-    # Initialize a.
-    a = defaultdict(lambda : defaultdict(int))
-    for w1, val_dict in cm.iteritems():
-        for w2 in val_dict.iterkeys():
-            if w1 == w2:
-                a[w1][w2] = 1.0                    
-    # Propagation.
-    pol_positive, a = propagate(positive, cm, vocab, a, iterations)
-    pol_negative, a = propagate(negative, cm, vocab, a, iterations)
-    beta = sum(pol_positive.values()) / sum(pol_negative.values())
-    for w in vocab:
-        pol[w] = pol_positive[w] - (beta * pol_negative[w])
-    return pol
-
-def propagate(seedset, cm, vocab, a, iterations):
+    # One run for both seed sets: the rows of a for the positive
+    # seeds come first.
+    pol, a = propagate(list(positive) + list(negative), cm, vocab, iterations)
+    in_vocab = set(vocab)
+    n_positive = len([w for w in positive if w in in_vocab])
+    # The tallies are summed in double precision, so that the scores
+    # are floats even though a is float32.
+    pol_positive = a[:n_positive].sum(axis=0, dtype=float)
+    pol_negative = a[n_positive:].sum(axis=0, dtype=float)
+    # As Python floats, so that a zero negative tally raises
+    # ZeroDivisionError rather than quietly making every score nan.
+    beta = float(pol_positive.sum()) / float(pol_negative.sum())
+    pol = pol_positive - (beta * pol_negative)
+    return dict(zip(vocab, pol))
+
+def propagate(seedset, cm, vocab, iterations):
     """
     Propagates the initial seedset, with the cosine measures
-    determining strength.
+    determining strength. The matrix a has a row for each seed word,
+    starting at 1.0 for the seed itself and 0.0 elsewhere. Each
+    iteration extends the paths from the seeds by one step: a[i, j]
+    becomes the max of itself and a[i, k] * cm[k, j] over all k, so
+    strength can come from somewhere other than the seed directly.
     
     Input
     seedset -- list of strings.
     cm -- cosine similarity matrix
     vocab -- the sorted vocabulary
-    a -- the new value matrix
     iterations -- the number of iteration to perform
 
     Output
-    pol -- dictionary mapping words to un-corrected polarity scores
-    a -- the updated matrix
+    pol -- array of un-corrected polarity scores, aligned with vocab
+    a -- the seeds x vocab matrix of path strengths, with a row for
+         each member of seedset in vocab, in the order of seedset
     """      
-    for w_i in seedset:
-        f = {}
-        f[w_i] = True
+    index = dict([(w, i) for i, w in enumerate(vocab)])
+    seeds = [index[w] for w in seedset if w in index]
+    a = zeros((len(seeds), len(vocab)), dtype=cm.dtype)
+    # One seed at a time, so that the intermediate products are at
+    # most vocab x vocab. A seed's row depends only on the seed, so
+    # repeats (say, a word in both seed sets) are copied, not rerun.
+    first_row = {}
+    for row, seed in enumerate(seeds):
+        if seed in first_row:
+            a[row] = a[first_row[seed]]
+            continue
+        first_row[seed] = row
+        a[row, seed] = 1.0
+        # Only words whose values went up in the previous iteration
+        # can raise anything in this one; the others have already had
+        # their say. When there are none, the row has converged.
+        changed = a[row] > 0.0
         for t in range(iterations):
-            for w_k in cm.keys():
-                if w_k in f:
-                    for w_j, val in cm[w_k].items():
-                        # New value is max{ old-value, cos(k, j) } --- so strength
-                        # can come from somewhere other th
-                        a[w_i][w_j] = max([a[w_i][w_j], a[w_i][w_k] * cm[w_k][w_j]])
-                        f[w_j] = True
+            if not changed.any():
+                break
+            new = a[row].copy()
+            ks = flatnonzero(changed)
+            for start in range(0, len(ks), PROPAGATION_BLOCK):
+                block = ks[start:start+PROPAGATION_BLOCK]
+                maximum(new, (a[row][block][:, newaxis] * cm[block]).max(axis=0), new)
+            changed = new > a[row]
+            a[row] = new
     # Score tally.
-    pol = {}
-    for w in vocab:
-        pol[w] = sum(a[w_i][w] for a_i in seedset)
+    pol = a.sum(axis=0)
     return [pol, a]
 
 ######################################################################
@@ -209,18 +274,19 @@ def propagate(seedset, cm, vocab, a, iterations):
 def format_matrix(vocab, m):
     """
     For display purposes: builds an aligned and neatly rounded version
-    of the two-dimensional dictionary m, assuming ordered values
-    vocab. Returns string s.
+    of the matrix m, whose rows and columns are ordered as in vocab.
+    Returns string s.
     """
-    s = ""
-    sep = ""
     col_width = 15
-    s += " ".rjust(col_width) + sep.join(map((lambda x : x.rjust(col_width)), vocab)) + "\n"
-    for w1 in vocab:
-        row = [w1]
-        row += [round(m[w1][w2], 2) for w2 in vocab]
-        s += sep.join(map((lambda x : str(x).rjust(col_width)), row)) + "\n"
-    return s
+    # Each line is a single format operation: a label column and then
+    # one column per word.
+    line = ("%%%ds" % col_width) * (len(vocab) + 1) + "\n"
+    lines = [line % tuple([" "] + list(vocab))]
+    # Python's round(), which rounds halves away from zero, rather
+    # than numpy's around(), which rounds them to even.
+    for w1, row in zip(vocab, asarray(m, dtype=float).tolist()):
+        lines.append(line % tuple([w1] + [round(x, 2) for x in row]))
+    return "".join(lines)
 
 ######################################################################
 # DEMO
@@ -259,7 +325,8 @@ if __name__ == "__main__":
     print "======================================================================"
     print "Co-occurence matrix:\n"
 
-    print format_matrix(vocab, d)
+    # Just the triangle that d stores.
+    print format_matrix(vocab, triu(get_vectors(d, vocab)))
 
     print "======================================================================"
     print "Cosine similarity matrix:\n"
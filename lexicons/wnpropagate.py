@@ -125,11 +125,16 @@ def wordnet_sense_propagate(synsets_list, iterations, remove_overlap=True, metho
     """
     # Intialize the output matrix.
     t = [[synsets] for synsets in synsets_list]
+    # The propagated sets carry their synsets forward from one
+    # iteration to the next, so we remember what we found for each
+    # synset rather than asking WordNet again.
+    same_cache = {}
+    other_cache = {}
     for i in xrange(iterations):
         new_vals = {}
         for j in xrange(len(synsets_list)):
             # Same-polarity relations from the current synset.
-            new_same = same_polarity(t[j][i], methods=methods)
+            new_same = same_polarity(t[j][i], methods=methods, cache=same_cache)
             # Get the union of all the opposing synsets.
             others = {}
             for k in xrange(len(synsets_list)):
@@ -137,7 +142,7 @@ def wordnet_sense_propagate(synsets_list, iterations, remove_overlap=True, metho
                     for other_synset in t[k][i]:
                         others[other_synset.name] = other_synset
             # Other-polarity relations from others.
-            new_diff = other_polarity(others.values(), methods)
+            new_diff = other_polarity(others.values(), methods, cache=other_cache)
             # Append the new synset. We append the values, which are
             # seed sets. We don't need the keys, which are synset
             # names used only for book-keeping.
@@ -153,50 +158,72 @@ def wordnet_sense_propagate(synsets_list, iterations, remove_overlap=True, metho
             t[j].append(dict_subtract(new_vals[j], overlap).values())
     return t
 
-def same_polarity(synsets, methods):
+def same_polarity(synsets, methods, cache=None):
     """
     Arguments:
     synsets -- a list of synsets
 
     methods -- the methods to use, presumed to be a subset of
     (methods & SYNSET_METHODS)
+
+    Keyword argument:
+    cache -- dictionary mapping synset.name to the synsets found for it
+    by an earlier call with the same methods; it is filled in as we go
+    (default: None, for no caching)
     
     As mentioned in the opening docstring, the method uses
     dictionaries, with synset.name mapped to synset, to get around
     limitations on NLTK Synset objects.
     """
+    if cache is None:
+        cache = {}
+    synset_methods = methods & SYNSET_METHODS
+    lemma_methods = methods & LEMMA_METHODS
     new_synsets = {}
     for synset in synsets:
-        new_synsets[synset.name] = synset
-        # Synset-level relations.
-        for synset_method in (methods & SYNSET_METHODS):
-            for related_synset in eval("synset." + synset_method + "()"):
-                new_synsets[related_synset.name] = related_synset
-        # Lemma-level relations.
-        for lemma in synset.lemmas:
-            for lemma_method in (methods & LEMMA_METHODS):
-                for related_lemma in eval("lemma." + lemma_method + "()"):
-                    new_synsets[related_lemma.synset.name] = related_lemma.synset
+        if synset.name not in cache:
+            related = {synset.name: synset}
+            # Synset-level relations.
+            for synset_method in synset_methods:
+                for related_synset in getattr(synset, synset_method)():
+                    related[related_synset.name] = related_synset
+            # Lemma-level relations.
+            for lemma in synset.lemmas:
+                for lemma_method in lemma_methods:
+                    for related_lemma in getattr(lemma, lemma_method)():
+                        related[related_lemma.synset.name] = related_lemma.synset
+            cache[synset.name] = related
+        new_synsets.update(cache[synset.name])
     return new_synsets
 
-def other_polarity(synsets, methods):
+def other_polarity(synsets, methods, cache=None):
     """
     Arguments:
     synsets -- a list of synsets
 
     methods -- the methods to use, presumed to be a subset of
     (methods & OPPOSING_METHODS)
+
+    Keyword argument:
+    cache -- as for same_polarity() (default: None)
     
     As mentioned in the opening docstring, the method uses
     dictionaries, with synset.name mapped to synset, to get around
     limitations on NLTK Synset objects.
     """
+    if cache is None:
+        cache = {}
+    lemma_methods = methods & OPPOSING_METHODS
     new_synsets = {}
     for synset in synsets:
-        for lemma in synset.lemmas:
-            for lemma_method in (methods & OPPOSING_METHODS):
-                for alt_lemma in eval("lemma." + lemma_method + "()"):
-                    new_synsets[alt_lemma.synset.name] = alt_lemma.synset
+        if synset.name not in cache:
+            related = {}
+            for lemma in synset.lemmas:
+                for lemma_method in lemma_methods:
+                    for alt_lemma in getattr(lemma, lemma_method)():
+                        related[alt_lemma.synset.name] = alt_lemma.synset
+            cache[synset.name] = related
+        new_synsets.update(cache[synset.name])
     return new_synsets
 
 ######################################################################